@@ -24,9 +24,7 @@
 from __future__ import division
 from __future__ import print_function
 import alsaaudio
-import itertools
 import numpy as np
-import struct
 
 """
 A class implementing buffered audio I/O.
@@ -37,48 +35,50 @@ class Audio:
 	Initializes the audio buffer.
 	"""
 	def __init__(self, low_res = False):
-		self.__stride = 4
 		self.__low_res = low_res
+		self.__dtype = np.dtype("<i2" if low_res else ">i4")
+		self.__scratch = np.empty(0, dtype = np.float64)
 		self.__pre_post = 0
 	
 	"""
 	Serialize the audio samples from an array of integers into a binary string.
 	"""
 	def serialize(self, a):
-		s = ""
-		fmt = "<h" if self.__low_res else ">i"
-		
-		# Process each element.
-		for elem in a:
-			s += struct.pack(fmt, elem)
-		
-		return s
+		return np.ascontiguousarray(a, dtype = self.__dtype).tobytes()
 	
 	"""
 	Deserialize the audio samples from a binary string into an array of integers.
 	"""
 	def deserialize(self, s):
-		endianness, fmt, the_stride = ("<", "h", self.__stride // 2) if self.__low_res else (">", "i", self.__stride)
-		return struct.unpack(endianness + (fmt * (len(s) // the_stride)), s)
+		return np.frombuffer(s, dtype = self.__dtype)
 	
 	"""
 	Normalize the audio samples from an array of integers into an array of floats with unity level.
 	"""
 	def normalize(self, data, max_val):
-		data = np.array(data)
 		fac = 1.0 / max_val
-		data = fac * data
-		return data
+		return np.multiply(data, fac, dtype = np.float64)
 	
 	"""
 	Denormalize the data from an array of floats with unity level into an array of integers.
+	
+	If an output array is passed, the result is written into its first elements instead of
+	a newly allocated array.
 	"""
-	def denormalize(self, data, max_val):
+	def denormalize(self, data, max_val, out = None):
 		fac = 1.0 * max_val
-		data = np.array(data)
-		data = np.clip(data, -1.0, 1.0)
-		data = (fac * data).astype(np.int64)
-		return data
+		data = np.asarray(data, dtype = np.float64)
+		n = len(data)
+		
+		# Grow the scratch buffer if it is too small for this chunk.
+		if len(self.__scratch) < n:
+			self.__scratch = np.empty(n, dtype = np.float64)
+		
+		scratch = self.__scratch[: n]
+		np.clip(data, -1.0, 1.0, out = scratch)
+		out = np.empty(n, dtype = self.__dtype) if out is None else out[: n]
+		np.multiply(scratch, fac, out = out, casting = "unsafe")
+		return out
 
 """
 This class implements a linear congruency generator (LCG).
@@ -119,7 +119,30 @@ class LCG:
     This method draws n samples in the interval [0, 1] from a uniform distribution.
     """
     def draw_uniform(self, n = 1):
-        return np.array(list(itertools.islice(self, int(n)))) / self.__c
+        n = int(n)
+        states = np.empty(n, dtype = np.int64)
+        
+        # Nothing to draw.
+        if n < 1:
+            return states / self.__c
+        
+        states[0] = self.next()
+        a, b, c = self.__a, self.__b, self.__c
+        m = 1
+        
+        # Jump ahead m steps at once, doubling m each time, since
+        # x[i + m] = (a^m * x[i] + b * (a^(m - 1) + ... + 1)) mod c.
+        while m < n:
+            k = min(m, n - m)
+            block = states[m : m + k]
+            np.multiply(states[: k], a, out = block)
+            block += b
+            block %= c
+            a, b = (a * a) % c, ((a * b) + b) % c
+            m += k
+        
+        self.__state = int(states[-1])
+        return states / self.__c
 
 # Program entry point.
 if __name__ == "__main__":
@@ -144,14 +167,19 @@ if __name__ == "__main__":
 	outp.setformat(alsaaudio.PCM_FORMAT_S32_BE)
 	outp.setperiodsize(num * 4)
 	
+	# Stage one period at a time in the same buffers.
+	pdata = np.empty(num, dtype = ">i4")
+	period_bytes = []
+	
+	# Convert the test signal into binary format once, one chunk per period.
+	for i in range(0, len(ndata), num):
+		pbuf = audio.denormalize(ndata[i : i + num], 0x7fffffff, out = pdata)
+		period_bytes.append(audio.serialize(pbuf))
+	
 	# Output test signal in an infinite loop.
 	while True:
-		rdata = np.copy(ndata)
 		
-		# Proceed onto the next chunk until we wrote it all out.
-		while len(rdata) > 0:
-			ldata, rdata = rdata[0 : num], rdata[num : ]
-			pdata = audio.denormalize(ldata, 0x7fffffff)
-			data = audio.serialize(pdata)
+		# Write out one chunk per period.
+		for data in period_bytes:
 			outp.write(data)
 
@@ -36,7 +36,6 @@
 
 from __future__ import division
 import numpy as np
-import struct
 import sys
 import wave
 
@@ -49,63 +48,101 @@ class Audio:
 	Initializes the audio buffer.
 	"""
 	def __init__(self, low_res = False):
-		self.__stride = 4
 		self.__low_res = low_res
+		self.__dtype = np.dtype("<i2" if low_res else ">i4")
+		self.__scratch = np.empty(0, dtype = np.float64)
 		self.__pre_post = 0
 		
 	"""
 	Serialize the audio samples from an array of integers into a binary string.
 	"""
 	def serialize(self, a):
-		s = ""
-		fmt = "<h" if self.__low_res else ">i"
-		
-		# Process each element.
-		for elem in a:
-			s += struct.pack(fmt, elem)
-		
-		return s
+		return np.ascontiguousarray(a, dtype = self.__dtype).tobytes()
 	
 	"""
 	Deserialize the audio samples from a binary string into an array of integers.
 	"""
 	def deserialize(self, s):
-		endianness, fmt, the_stride = ("<", "h", self.__stride // 2) if self.__low_res else (">", "i", self.__stride)
-		return struct.unpack(endianness + (fmt * (len(s) // the_stride)), s)
+		return np.frombuffer(s, dtype = self.__dtype)
 		
 	"""
 	Normalize the audio samples from an array of integers into an array of floats with unity level.
 	"""
 	def normalize(self, data, max_val):
-		data = np.array(data)
 		fac = 1.0 / max_val
-		data = fac * data
-		return data
+		return np.multiply(data, fac, dtype = np.float64)
 		
 	"""
 	Denormalize the data from an array of floats with unity level into an array of integers.
+	
+	The data is multiplied by scale first, so that it ends up with unity level.
 	"""
-	def denormalize(self, data, max_val):
-		fac = 1.0 * max_val
-		data = np.array(data)
-		data = np.clip(data, -1.0, 1.0)
-		data = (fac * data).astype(np.int64)
-		return data
+	def denormalize(self, data, max_val, scale = 1.0):
+		fac = scale * max_val
+		limit = 1.0 / scale
+		data = np.asarray(data)
+		n = len(data)
+		
+		# Grow the scratch buffer if it is too small for this chunk.
+		if len(self.__scratch) < n:
+			self.__scratch = np.empty(n, dtype = np.float64)
+		
+		scratch = self.__scratch[: n]
+		np.clip(data, -limit, limit, out = scratch)
+		out = np.empty(n, dtype = self.__dtype)
+		np.multiply(scratch, fac, out = out, casting = "unsafe")
+		return out
 
 """
-Derives an impulse response.
+Derives an impulse response of the given type and returns it together with its peak level.
 """
-def derive(ir):
-	der = []
+def derive(ir, dtype = np.float64, block_size = 0x10000):
+	ir = np.asarray(ir)
 	n = len(ir)
-	der.append(0.0)
+	der = np.empty(n, dtype = dtype)
+	der[0] = 0
+	der[-1] = 0
+	peak = 0
 
-	# Calculate central differences.
-	for i in range(1, n - 1):
-		der.append(ir[i + 1] - ir[i - 1])
+	# Calculate central differences block by block, so that each block is still cached
+	# when looking for its peak level.
+	for i in range(1, n - 1, block_size):
+		j = min(i + block_size, n - 1)
+		block = der[i : j]
+		np.subtract(ir[i + 1 : j + 1], ir[i - 1 : j - 1], out = block, dtype = dtype)
+		peak = max(peak, np.max(block), -np.min(block))
 
-	der.append(0.0)
-	return np.array(der)
+	return der, peak
+
+"""
+Returns the smallest length not less than n, which has no prime factors other than 2, 3 and 5.
+"""
+def fast_length(n):
+	best = 1
+	
+	# Start with the next power of two.
+	while best < n:
+		best *= 2
+	
+	p5 = 1
+	
+	# Try all products of powers of three and five below that.
+	while p5 < best:
+		p35 = p5
+		
+		while p35 < best:
+			p = p35
+			
+			# Fill up with powers of two.
+			while p < n:
+				p *= 2
+			
+			best = min(best, p)
+			p35 *= 3
+		
+		p5 *= 5
+	
+	return best
 
 # Program entry point.
 if __name__ == "__main__":
@@ -127,77 +164,55 @@ if __name__ == "__main__":
 			if sys.argv[3] == "postprocess":
 				post_process = True
 		
-		# Read wave parameters and start reading data.
+		# Read wave parameters and all data.
 		params = in_wav.getparams()
 		out_wav.setparams(params)
-		buf = in_wav.readframes(8192)
-		data = []
-		
-		# Read more data into buffer until end of file.
-		while len(buf) > 0:
-			data.append(buf)
-			buf = in_wav.readframes(8192)
-		
-		# Make sure we do not forget the last chunk.
-		data.append(buf)
-		ndata = []
-		
-		# Normalize and concatenate all buffers.
-		for buf in data:
-			pbuf = audio.deserialize(buf)
-			nbuf = audio.normalize(pbuf, 0x7fff)
-			ndata.extend(nbuf)
-		
-		# Calculate the derivative.
-		ndata = derive(ndata)
+		buf = in_wav.readframes(in_wav.getnframes())
+		
+		# Calculate the derivative directly from the integer samples. There is no need to
+		# normalize them first, since the result gets scaled into unit range anyway. Unless
+		# we perform post-processing, the differences of 16 bit samples are exact in 32 bit
+		# integers, so we only convert to floating point when scaling the result.
+		pbuf = audio.deserialize(buf)
+		ndata, peak = derive(pbuf, np.float64 if post_process else np.int32)
 		data_length = len(ndata)
 		
 		# Perform optional post-processing on the impulse response.
 		if post_process:
 			
-			# Zero-pad the signal to prevent aliasing.
-			zeros = np.zeros_like(ndata)
-			ndata = np.append(ndata, zeros)
+			# Zero-pad the signal to at least twice its length to prevent aliasing. Pad a bit
+			# further if that gives a length the FFT can factor into small primes.
+			n = fast_length(2 * data_length)
 			
-			# Calculate the Fourier transform.
+			# Calculate the Fourier transform of the real-valued signal.
 			samplerate = in_wav.getframerate()
 			samplerate_inv = 1.0 / samplerate
-			ndata_fft = np.fft.fft(ndata)
-			n = len(ndata_fft)
-			freqs = np.fft.fftfreq(n, samplerate_inv)
+			ndata_fft = np.fft.rfft(ndata, n)
+			freqs = np.fft.rfftfreq(n, samplerate_inv)
 			
 			# Set the Fourier transform to zero if frequency is outside the audible range.
-			for i in range(0, len(freqs)):
-				freq = np.absolute(freqs[i])
-				
-				# If Frequency is inaudible, clear this frequency band.
-				if (freq < 20.0) | (freq > 20000.0):
-					ndata_fft[i] = 0.0
+			# The frequencies are sorted, so this only clears both ends of the spectrum.
+			lower = np.searchsorted(freqs, 20.0, side = "left")
+			upper = np.searchsorted(freqs, 20000.0, side = "right")
+			ndata_fft[: lower] = 0.0
+			ndata_fft[upper :] = 0.0
 			
 			# Calculate the inverse Fourier transform.
-			ndata_ifft = np.fft.ifft(ndata_fft)
-			ndata = np.real(ndata_ifft)
-		
+			ndata = np.fft.irfft(ndata_fft, n)
+			
 			# Truncate off aliased IFFT values.
 			ndata = ndata[: data_length]
+			
+			# Find the new peak level.
+			peak = max(np.max(ndata), -np.min(ndata))
 		
 		# Scale samples into unit range.
-		ndata_abs = np.absolute(ndata)
-		peak = np.max(ndata_abs)
 		scale = 1.0 / peak
-		ndata *= scale
-		data = []
-		
-		# Convert all data into binary format.
-		for i in range(0, len(ndata), 8192):
-			nbuf = ndata[i : i + 8192]
-			pbuf = audio.denormalize(nbuf, 0x7fff)
-			buf = audio.serialize(pbuf)
-			data.append(buf)
 		
-		# Write the result.
-		for buf in data:
-			out_wav.writeframes(buf)
+		# Convert all data into binary format and write the result.
+		pbuf = audio.denormalize(ndata, 0x7fff, scale)
+		buf = audio.serialize(pbuf)
+		out_wav.writeframes(buf)
 		
 		# Close the file descriptors.
 		out_wav.close()